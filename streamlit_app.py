@@ -15,15 +15,32 @@
 # ------------------------------------------------------------
 from __future__ import annotations
 
+import os
 import re
 import json
+import string
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone, time as dt_time
-from typing import Dict, Any, List, Tuple
+from typing import Callable, Dict, Any, Iterator, List, Tuple
+from zoneinfo import ZoneInfo
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 import streamlit as st
+import streamlit.components.v1 as components
+
+
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """WP 送信・Gemini 送信・方針キャッシュ保存で使う JSON エンコード（UTF-8 bytes のまま渡す）"""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+loads_json = orjson.loads
 
 # ==============================
 # 基本設定
@@ -48,6 +65,49 @@ HEADERS = {
     "Accept": "application/json",
     "Content-Type": "application/json; charset=utf-8",
 }
+GEMINI_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+GEMINI_ORIGIN = "https://generativelanguage.googleapis.com"
+GEMINI_TIMEOUT = (5, 90)  # (connect, read)：接続で詰まったら即失敗させ、生成待ちにだけ長く待つ
+GEMINI_CACHE_DIR = Path("./gemini_cache")  # 同一プロンプトの応答をディスクに残す（再起動後も有効）
+GEMINI_CACHE_TTL = 24 * 3600  # 秒
+SCHEDULE_TZ = ZoneInfo("Asia/Tokyo")  # 予約日時の入力はJSTとして解釈
+
+# ------------------------------
+# HTTP セッション（WP / Gemini 共通・keep-alive で再接続を省く）
+# ------------------------------
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        # 429/5xx は Retry-After を尊重して指数バックオフ。POST（投稿）は既定で再送しない（二重投稿防止）。
+        # 使い切ったら例外ではなく最後のレスポンスを返し、呼び出し側のステータス表示に任せる
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          respect_retry_after_header=True, raise_on_status=False),
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    # Gemini は専用プール（並列呼び出しが WP 側のソケットと取り合わない）。
+    # generateContent は POST なので allowed_methods に含め、429 時は Retry-After に従う。
+    # 再送はステータス（429/5xx）と接続失敗のみ。読み取りタイムアウトは生成が走っている可能性があるので再送しない
+    s.mount(GEMINI_ORIGIN, HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=8,
+        max_retries=Retry(total=4, connect=2, read=0, other=0, backoff_factor=1.0,
+                          status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=frozenset({"POST"}), respect_retry_after_header=True,
+                          raise_on_status=False),
+    ))
+    return s
+
+SESSION = get_http_session()
+
+# WP への HTTP 呼び出し履歴（rerun ごとに空から。サイドバーの Debug HTTP で最後にまとめて表示）
+_HTTP_LOG: List[str] = []
+
+def _log_http(method: str, url: str, r: requests.Response | None) -> None:
+    _HTTP_LOG.append(f"{method} {url} → {r.status_code if r is not None else 'N/A'}")
 
 # ------------------------------
 # WP エンドポイント補助
@@ -55,42 +115,285 @@ HEADERS = {
 def ensure_trailing_slash(url: str) -> str:
     return url if url.endswith("/") else url + "/"
 
-def api_candidates(base: str, route: str) -> List[str]:
+@st.cache_resource
+def wp_client(site_key: str) -> Tuple[str, HTTPBasicAuth]:
+    """サイトごとの (BASE, AUTH)。rerun のたびに作り直さない"""
+    cfg = WP_CONFIGS[site_key]
+    return ensure_trailing_slash(cfg["url"]), HTTPBasicAuth(cfg["user"], cfg["password"])
+
+def _scheme_key(base: str) -> str:
+    return f"scheme::{ensure_trailing_slash(base)}"
+
+def working_scheme(base: str) -> str | None:
+    """このサイトで成功した URL 形式（"rest_route" / "wp_json"）。未確定なら None。"""
+    return st.session_state.get(_scheme_key(base))
+
+def remember_scheme(base: str, url: str) -> None:
+    st.session_state[_scheme_key(base)] = "rest_route" if "?rest_route=" in url else "wp_json"
+
+def forget_scheme(base: str) -> None:
+    st.session_state.pop(_scheme_key(base), None)
+
+def _other_scheme(scheme: str) -> str:
+    return "wp_json" if scheme == "rest_route" else "rest_route"
+
+def api_candidates(base: str, route: str, prefer: str | None = None) -> List[str]:
     base = ensure_trailing_slash(base)
     route = route.lstrip("/")
+    # 成功実績のある形式があればその1本だけ
+    if prefer == "rest_route":
+        return [f"{base}?rest_route=/{route}"]
+    if prefer == "wp_json":
+        return [f"{base}wp-json/{route}"]
     # ?rest_route= 優先（WAF回避）
     return [f"{base}?rest_route=/{route}", f"{base}wp-json/{route}"]
 
-def wp_get(base: str, route: str, auth: HTTPBasicAuth, headers: Dict[str, str]) -> requests.Response | None:
+def _wp_get_race(base: str, urls: List[str], auth: HTTPBasicAuth,
+                 headers: Dict[str, str]) -> requests.Response | None:
+    """形式が未確定のときは両候補へ同時に GET し、先に 200 を返した方を採用する"""
+    ex = ThreadPoolExecutor(max_workers=len(urls))
+    futures = {ex.submit(SESSION.get, url, auth=auth, headers=headers, timeout=20): url for url in urls}
     last = None
-    for url in api_candidates(base, route):
-        r = requests.get(url, auth=auth, headers=headers, timeout=20)
-        last = r
-        if r.status_code == 200:
-            return r
+    error: Exception | None = None
+    try:
+        for fut in as_completed(futures):
+            try:
+                r = fut.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            last = r
+            _log_http("GET", futures[fut], r)
+            if r.status_code == 200:
+                remember_scheme(base, futures[fut])
+                return r
+    finally:
+        # 負けた側は待たない（未開始なら取り消し）
+        ex.shutdown(wait=False, cancel_futures=True)
+    if last is None and error is not None:
+        raise error
     return last
 
+def wp_get(base: str, route: str, auth: HTTPBasicAuth, headers: Dict[str, str]) -> requests.Response | None:
+    prefer = working_scheme(base)
+    if prefer is None:
+        return _wp_get_race(base, api_candidates(base, route), auth, headers)
+    url = api_candidates(base, route, prefer)[0]
+    r = SESSION.get(url, auth=auth, headers=headers, timeout=20)
+    _log_http("GET", url, r)
+    if r.status_code not in (403, 404):
+        return r
+    # 確定済みの形式が 403/404 → 記憶を捨ててもう一方を試す
+    forget_scheme(base)
+    url = api_candidates(base, route, _other_scheme(prefer))[0]
+    r = SESSION.get(url, auth=auth, headers=headers, timeout=20)
+    _log_http("GET", url, r)
+    if r.status_code == 200:
+        remember_scheme(base, url)
+    return r
+
 def wp_post(base: str, route: str, auth: HTTPBasicAuth, headers: Dict[str, str],
             json_payload: Dict[str, Any]) -> requests.Response | None:
+    prefer = working_scheme(base)
+    body = dumps_json(json_payload)  # 候補URLを替えても再エンコードしない
+    if prefer is None:
+        urls = api_candidates(base, route)
+    else:
+        url = api_candidates(base, route, prefer)[0]
+        r = SESSION.post(url, auth=auth, headers=headers, data=body, timeout=45)
+        _log_http("POST", url, r)
+        if r.status_code not in (403, 404):
+            return r
+        forget_scheme(base)
+        urls = api_candidates(base, route, _other_scheme(prefer))
     last = None
-    for url in api_candidates(base, route):
-        r = requests.post(url, auth=auth, headers=headers, json=json_payload, timeout=45)
+    for url in urls:
+        r = SESSION.post(url, auth=auth, headers=headers, data=body, timeout=45)
+        _log_http("POST", url, r)
         last = r
-        if r.status_code in (200, 201):
+        if r.status_code in (200, 201, 207):  # 207 = batch/v1 の Multi-Status
+            remember_scheme(base, url)
             return r
     return last
 
+WP_BATCH_MAX = 25  # batch/v1 の1リクエストあたり上限（WP 既定）
+
+def _rest_error_code(r: requests.Response) -> str | None:
+    """REST API 自体が返したエラーの code。WAF やパーマリンク設定由来の HTML 404/403 なら None"""
+    try:
+        j = r.json()
+    except ValueError:
+        return None
+    return j.get("code") if isinstance(j, dict) else None
+
+def _wp_batch_request(base: str, auth: HTTPBasicAuth, headers: Dict[str, str],
+                      payload: Dict[str, Any]) -> requests.Response:
+    """batch/v1 への POST。別のURL形式で送り直すのは、REST に届かなかった（HTML の 403/404）ときだけ。
+    5xx などは作成済みの可能性があるので二度送らない。batch/v1 が無いだけで URL 形式の記憶は捨てない"""
+    body = dumps_json(payload)
+    prefer = working_scheme(base)
+    urls = api_candidates(base, "batch/v1")
+    if prefer is not None:
+        urls = api_candidates(base, "batch/v1", prefer) + api_candidates(base, "batch/v1", _other_scheme(prefer))
+    for url in urls:
+        r = SESSION.post(url, auth=auth, headers=headers, data=body, timeout=45)
+        _log_http("POST", url, r)
+        if r.status_code == 207:
+            remember_scheme(base, url)
+            return r
+        if r.status_code not in (403, 404) or _rest_error_code(r) is not None:
+            return r
+    return r
+
+def _batch_route_missing(r: requests.Response) -> bool:
+    """batch/v1 が無い（WP 5.6 未満など）。このときだけ1件ずつの投稿に切り替えてよい"""
+    if r.status_code != 404:
+        return False
+    code = _rest_error_code(r)
+    return code is None or code == "rest_no_route"  # REST に届かない HTML の 404 も未作成
+
+def wp_batch_post(base: str, auth: HTTPBasicAuth, headers: Dict[str, str],
+                  items: List[Dict[str, Any]]) -> List[Tuple[int | None, Dict[str, Any] | None]]:
+    """複数の wp/v2/posts 作成を batch/v1（WP 5.6+）で最大25件ずつまとめて送る。
+    戻り値は items と必ず同じ長さ・同順の (status, body)。batch/v1 が無いサイト（404）だけ1件ずつ wp_post に切り替える。
+    通信エラー・5xx・応答に結果が無い分は作成済みか分からないので、送り直さず失敗扱いで返す。"""
+    results: List[Tuple[int | None, Dict[str, Any] | None]] = []
+    batch_missing = False
+    for i in range(0, len(items), WP_BATCH_MAX):
+        chunk = items[i:i + WP_BATCH_MAX]
+        if not batch_missing:
+            try:
+                r = _wp_batch_request(base, auth, headers, {
+                    "validation": "require-all-validate",
+                    "requests": [{"method": "POST", "path": "/wp/v2/posts", "body": p} for p in chunk],
+                })
+            except requests.RequestException as e:
+                results.extend([(None, {"message": f"通信エラー: {e}（作成済みか確認してください）"})] * len(chunk))
+                continue
+            if r.status_code == 207:
+                try:
+                    responses = r.json().get("responses", [])
+                except (ValueError, AttributeError):
+                    responses = []
+                # 検証エラー時は全件未作成：エラー以外の要素は null で返る。足りない分も失敗扱い
+                for j in range(len(chunk)):
+                    if j >= len(responses):
+                        results.append((None, {"message": "batch 応答に結果がありません（作成済みか確認してください）"}))
+                    elif not isinstance(responses[j], dict):
+                        results.append((None, None))
+                    else:
+                        results.append((responses[j].get("status"), responses[j].get("body")))
+                continue
+            if not _batch_route_missing(r):
+                results.extend([(r.status_code, {"message": f"batch/v1 が {r.status_code} を返しました（作成済みか確認してください）"})] * len(chunk))
+                continue
+            batch_missing = True
+        for p in chunk:
+            try:
+                r1 = wp_post(base, "wp/v2/posts", auth, headers, json_payload=p)
+            except requests.RequestException as e:
+                results.append((None, {"message": f"通信エラー: {e}"}))
+                continue
+            if r1 is None:
+                results.append((None, None))
+                continue
+            try:
+                body = r1.json()
+            except ValueError:
+                body = {"message": r1.text[:300]}
+            results.append((r1.status_code, body))
+    return results
+
+@st.cache_resource
+def get_background_executor() -> ThreadPoolExecutor:
+    """待たずに投げっぱなしにする裏処理用（プロセスで1つ。rerun をまたいで使い回す）"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="bg")
+
+def prewarm_wp(base: str, auth: HTTPBasicAuth, headers: Dict[str, str]) -> None:
+    """投稿に備えて WP への接続（TLS/認証）を裏で温めておく。完了は待たず、結果も使わない（失敗も無視）"""
+    url = api_candidates(base, "wp/v2/users/me", working_scheme(base))[0]
+    get_background_executor().submit(SESSION.get, url, auth=auth, headers=headers, timeout=20)
+
+# ------------------------------
+# タグ除去（正規表現を使わない線形走査。閉じ忘れの "<" があっても遅くならない）
+# ------------------------------
+def strip_tags(s: str, multiline: bool = False) -> str:
+    """<...> を取り除いた文字列（re.sub(r'<.*?>', '', s) と同じ結果）。
+    既定ではタグは1行内で閉じるものだけ：同じ行に ">" が無い "<" は地の文として残す。
+    multiline=True なら改行をまたいで次の ">" までをタグとみなす（re.DOTALL 相当。後ろに ">" が無い "<" 以降は残す）"""
+    out: List[str] = []
+    i = 0
+    n = len(s)
+    while True:
+        lt = s.find("<", i)
+        if lt < 0:
+            out.append(s[i:])
+            break
+        end = -1 if multiline else s.find("\n", lt)
+        if end < 0:
+            end = n
+        gt = s.find(">", lt, end)
+        if gt < 0:
+            # この "<" が閉じないなら、同じ範囲にある後続の "<" も閉じない：範囲の終わりまで地の文
+            out.append(s[i:end])
+            if end >= n:
+                break
+            i = end
+            continue
+        out.append(s[i:lt])
+        i = gt + 1
+    return "".join(out)
+
+def split_p_chunks(html: str) -> List[str]:
+    """「直前の地の文 + <p>…</p>」単位に区切る（最後は残り全部）。
+    閉じていない <p> があっても後戻りせず、全体を1回なめるだけで済む"""
+    low = html.lower()
+    out: List[str] = []
+    i = 0
+    while True:
+        lt = low.find("<p>", i)
+        gt = low.find("</p>", lt + 3) if lt >= 0 else -1
+        if gt < 0:
+            out.append(html[i:])
+            if i < len(html):
+                out.append("")
+            return out
+        out.append(html[i:gt + 4])
+        i = gt + 4
+
+# ------------------------------
+# 正規表現（HTML パイプライン用・事前コンパイル）
+# ------------------------------
+_TAG_RE = re.compile(r'</?(\w+)[^>]*>', re.IGNORECASE)
+# validate_article 用：見出し / <p> / 表・箇条書き / 禁止タグ / <br> を1本の走査で拾う
+_VALIDATE_TOKEN_RE = re.compile(
+    r'<(?:(?P<head>h[23])>|(?P<p>p)>|(?P<list>ul|ol|table)\b|(?P<forbidden>h4|script|style)|(?P<br>br)\s*/?>)',
+    re.IGNORECASE,
+)
+_H2_TITLE_RE = re.compile(r'<h2>(.*?)</h2>', re.IGNORECASE | re.DOTALL)
+_H2_OPEN_RE = re.compile(r'<h2>', re.IGNORECASE)
+_HAS_SUMMARY_RE = re.compile(r'<h2>[^<]*まとめ[^<]*</h2>', re.IGNORECASE)
+_SUMMARY_H2_RE = re.compile(r'<h2>\s*まとめ\s*</h2>', re.IGNORECASE)
+_SLUG_DROP_RE = re.compile(r'[^a-z0-9\s-]')
+_SPACES_RE = re.compile(r'\s+')
+_DASHES_RE = re.compile(r'-{2,}')
+# タイトル/説明のクリーニング（固定文字の削除なので translate）・入力整形用
+_TITLE_DELETE = str.maketrans('', '', '【】｜\n\r')
+_DESC_DELETE = str.maketrans('', '', '\n\r')
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+_CO_TERMS_SPLIT_RE = re.compile(r'[,\n\r]+')
+
 # ==== まとめ欠落の自動補完ヘルパー ====
-import re
 
 def _has_summary(html: str) -> bool:
     """<h2>タグ内に「まとめ」を含む見出しがあるか判定（大文字小文字無視）"""
-    return bool(re.search(r'(?i)<h2>[^<]*まとめ[^<]*</h2>', html or ""))
+    return bool(_HAS_SUMMARY_RE.search(html or ""))
 
 def _extract_h2_titles(html: str):
     """本文中の <h2> タイトルを配列で返す（HTMLタグ除去、はじめに/まとめ除外）"""
-    titles = re.findall(r'(?is)<h2>(.*?)</h2>', html or "")
-    clean = [re.sub(r'<.*?>', '', t).strip() for t in titles]
+    titles = _H2_TITLE_RE.findall(html or "")
+    clean = [strip_tags(t).strip() for t in titles]
     return [t for t in clean if t and t not in ("はじめに", "まとめ")]
 
 def _append_fallback_summary(html: str) -> str:
@@ -109,83 +412,109 @@ def _append_fallback_summary(html: str) -> str:
 # ------------------------------
 # 生成ユーティリティ / バリデータ
 # ------------------------------
-ALLOWED_TAGS = ['h2', 'h3', 'p', 'strong', 'em', 'ul', 'ol', 'li', 'table', 'tr', 'th', 'td']  # <br>禁止
+ALLOWED_TAGS = frozenset({'h2', 'h3', 'p', 'strong', 'em', 'ul', 'ol', 'li', 'table', 'tr', 'th', 'td'})  # <br>禁止
 MAX_H2 = 8
 H2_RE = re.compile(r'(<h2>.*?</h2>)', re.IGNORECASE | re.DOTALL)
 
+def _keep_allowed_tag(m: re.Match) -> str:
+    return m.group(0) if m.group(1).lower() in ALLOWED_TAGS else ''
+
 def simplify_html(html: str) -> str:
-    # 許可タグ以外を除去 + <br>禁止
-    tags = re.findall(r'</?(\w+)[^>]*>', html)
-    for tag in set(tags):
-        if tag.lower() not in ALLOWED_TAGS:
-            html = re.sub(rf'</?{tag}[^>]*>', '', html, flags=re.IGNORECASE)
-    html = re.sub(r'<br\s*/?>', '', html, flags=re.IGNORECASE)
-    return html
+    # 許可タグ以外を除去 + <br>禁止（br は許可リスト外なので同じ1パスで落ちる）
+    return _TAG_RE.sub(_keep_allowed_tag, html)
+
+def preview_safe_html(html: str) -> str:
+    """プレビュー iframe 用。許可タグを属性なしの素のタグに置き換え、それ以外のタグと余った "<" は無害化する
+    （on*= 属性や <script> が iframe 内で実行されないように）"""
+    out: List[str] = []
+    pos = 0
+    for m in _TAG_RE.finditer(html):
+        out.append(html[pos:m.start()].replace("<", "&lt;"))
+        name = m.group(1).lower()
+        if name in ALLOWED_TAGS:
+            out.append(f"</{name}>" if m.group(0).startswith("</") else f"<{name}>")
+        pos = m.end()
+    out.append(html[pos:].replace("<", "&lt;"))
+    return "".join(out)
 
 def validate_article(html: str) -> List[str]:
     warns: List[str] = []
-    if re.search(r'<h4|<script|<style', html, flags=re.IGNORECASE):
+    # タグを1回だけ走査し、禁止タグ / <br> / H2ごとの表・箇条書き / H3直下の<p>数 をまとめて集計
+    forbidden = has_br = False
+    h2_has_list: List[bool] = []
+    h3_p_counts: List[int] = []
+    in_h3 = False
+    for m in _VALIDATE_TOKEN_RE.finditer(html):
+        kind = m.lastgroup
+        if kind == "head":
+            in_h3 = m.group("head").lower() == "h3"
+            if in_h3:
+                h3_p_counts.append(0)
+            else:
+                h2_has_list.append(False)
+        elif kind == "p":
+            if in_h3:
+                h3_p_counts[-1] += 1
+        elif kind == "list":
+            if h2_has_list:
+                h2_has_list[-1] = True
+        elif kind == "forbidden":
+            forbidden = True
+        else:
+            has_br = True
+    if forbidden:
         warns.append("禁止タグ（h4/script/style）が含まれています。")
-    if re.search(r'<br\s*/?>', html, flags=re.IGNORECASE):
+    if has_br:
         warns.append("<br> タグは使用禁止です。すべて <p> に置き換えてください。")
     # H2ごとに表or箇条書き
-    h2_iter = list(re.finditer(r'(<h2>.*?</h2>)', html, flags=re.DOTALL | re.IGNORECASE))
-    for i, m in enumerate(h2_iter):
-        start = m.end()
-        end = h2_iter[i + 1].start() if i + 1 < len(h2_iter) else len(html)
-        section = html[start:end]
-        if not re.search(r'<(ul|ol|table)\b', section, flags=re.IGNORECASE):
+    for has_list in h2_has_list:
+        if not has_list:
             warns.append("H2セクションに表（table）または箇条書き（ul/ol）が不足しています。")
     # h3直下の<p>分量
-    h3_positions = list(re.finditer(r'(<h3>.*?</h3>)', html, flags=re.DOTALL | re.IGNORECASE))
-    for i, m in enumerate(h3_positions):
-        start = m.end()
-        next_head = re.search(r'(<h2>|<h3>)', html[start:], flags=re.IGNORECASE)
-        end = start + next_head.start() if next_head else len(html)
-        block = html[start:end]
-        p_count = len(re.findall(r'<p>.*?</p>', block, flags=re.DOTALL | re.IGNORECASE))
+    for p_count in h3_p_counts:
         if p_count < 3 or p_count > 6:
             warns.append("各<h3>直下は4〜5文（<p>）が目安です。分量を調整してください。")
     # 全文ざっくり長さ
-    plain = re.sub(r'<.*?>', '', html)
+    plain = strip_tags(html)
     if len(plain.strip()) > 6000:
         warns.append("記事全体が6000文字を超えています。要約・整理してください。")
     return warns
 
+# rerun ごとのプレビュー検査・投稿前整形は、本文が同じなら結果を使い回す
+@st.cache_data(max_entries=32, show_spinner=False)
+def simplify_html_cached(html: str) -> str:
+    return simplify_html(html)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def validate_article_cached(html: str) -> List[str]:
+    return validate_article(html)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def preview_safe_html_cached(html: str) -> str:
+    return preview_safe_html(html)
+
 def count_h2(html: str) -> int:
     return len(H2_RE.findall(html or ""))
 
 def trim_h2_max(structure_html: str, max_count: int) -> str:
-    parts = H2_RE.split(structure_html)
-    out: List[str] = []
-    h2_seen = 0
-    i = 0
-    while i < len(parts):
-        chunk = parts[i]
-        if H2_RE.match(chunk or ""):
-            h2_seen += 1
-            if h2_seen <= max_count:
-                out.append(chunk)
-                if i + 1 < len(parts):
-                    out.append(parts[i + 1])
-            i += 2
-            continue
-        else:
-            if h2_seen == 0:
-                out.append(chunk)
-            i += 1
-    return "".join(out)
+    # 開始タグ数が上限以下なら何も削らない（正規表現を回さず返す）
+    if structure_html.count("<h2>") + structure_html.count("<H2>") <= max_count:
+        return structure_html
+    # 残すのは先頭〜上限番目のH2ブロックまでの連続区間 = (max_count+1) 番目のH2の直前まで
+    for i, m in enumerate(H2_RE.finditer(structure_html)):
+        if i == max_count:
+            return structure_html[:m.start()]
+    return structure_html
 
 def strip_existing_summary_h2(structure_html: str) -> str:
     """構成③中に紛れた「まとめ」系H2をすべて除去（構成は本文用だけにする）"""
     # 「まとめ」を含む<h2>～直後の<h3>群を丸ごと消す（次の<h2>直前まで）
     out = []
     i = 0
-    pattern_h2 = re.compile(r'(?is)<h2>(.*?)</h2>')
-    matches = list(pattern_h2.finditer(structure_html))
+    matches = list(_H2_TITLE_RE.finditer(structure_html))
     last_end = 0
     for idx, m in enumerate(matches):
-        title = re.sub(r'<.*?>', '', m.group(1) or '').strip()
+        title = strip_tags(m.group(1) or '').strip()
         next_start = matches[idx + 1].start() if idx + 1 < len(matches) else len(structure_html)
         block = structure_html[m.start():next_start]
         if "まとめ" in title:
@@ -212,8 +541,7 @@ def enforce_summary_last(structure_html: str, keyword: str, total_h2: int) -> st
 
     # 本文用の上限は total_h2 - 1
     content_max = max(total_h2 - 1, 0)
-    if count_h2(structure_html) > content_max:
-        structure_html = trim_h2_max(structure_html, content_max)
+    structure_html = trim_h2_max(structure_html, content_max)
 
     # 最後に「まとめ」H2を強制付与
     summary_h2 = f"\n<h2>{keyword}に関するまとめ</h2>\n"
@@ -224,25 +552,23 @@ def enforce_summary_last(structure_html: str, keyword: str, total_h2: int) -> st
 # 本文文字数制御（必要なら再利用）
 # ------------------------------
 
-import re
-
 def _summary_span(html: str) -> tuple[int, int] | None:
     """<h2>まとめ</h2> セクションの [開始, 終了) インデックスを返す。無ければ None。"""
-    m = re.search(r'(?i)<h2>\s*まとめ\s*</h2>', html)
+    m = _SUMMARY_H2_RE.search(html)
     if not m:
         return None
     start = m.start()
     # 次の<h2> までが まとめセクション
-    m2 = re.search(r'(?i)<h2>', html[m.end():])
+    m2 = _H2_OPEN_RE.search(html[m.end():])
     end = m.end() + (m2.start() if m2 else 0)
     return (start, end if m2 else len(html))
 
 def _visible_len(s: str) -> int:
-    return len(re.sub(r'<.*?>', '', s or '', flags=re.DOTALL).strip())
+    return len(strip_tags(s or '', multiline=True).strip())
 
 def _trim_by_p(html_block: str, limit: int) -> str:
     """<p>単位で前から積み上げて limit 以内に収める（タグは壊さない素朴版）。"""
-    parts = re.findall(r'(?si).*?(?:<p>.*?</p>|$)', html_block)
+    parts = split_p_chunks(html_block)
     out = ""
     for part in parts:
         cand = out + part
@@ -268,13 +594,13 @@ def cap_summary(html: str, limit_chars: int = 320) -> str:
 # 本文文字数制御（必要なら再利用）
 # ------------------------------
 def visible_length(html: str) -> int:
-    text = re.sub(r'<.*?>', '', html or '', flags=re.DOTALL)
+    text = strip_tags(html or '', multiline=True)
     return len(text.strip())
 
 def trim_to_max_chars(html: str, limit: int) -> str:
     if visible_length(html) <= limit:
         return html
-    parts = re.findall(r'(?si).*?(?:<p>.*?</p>|$)', html)
+    parts = split_p_chunks(html)
     out = ""
     for part in parts:
         if visible_length(out + part) <= limit:
@@ -313,17 +639,117 @@ def prompt_append_chars(keyword: str, co_terms: List[str], current_html: str, ne
 def call_gemini(prompt: str, temperature: float = 0.2, model: str = "gemini-1.5-pro") -> str:
     if not GEMINI_KEY:
         raise RuntimeError("Gemini APIキーが未設定です。Secrets に google.gemini_api_key_1 を追加してください。")
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={GEMINI_KEY}"
+    return _gemini_text(prompt, temperature, model)
+
+def call_gemini_many(prompts: List[str], temperature: float = 0.2, model: str = "gemini-1.5-pro") -> List[str]:
+    """互いに独立したプロンプトを同時に投げ、prompts と同順で結果を返す（Gemini 用プール上限 8 に合わせる）"""
+    if not GEMINI_KEY:
+        raise RuntimeError("Gemini APIキーが未設定です。Secrets に google.gemini_api_key_1 を追加してください。")
+    if len(prompts) <= 1:
+        return [_gemini_text(p, temperature, model) for p in prompts]
+    with ThreadPoolExecutor(max_workers=min(8, len(prompts))) as ex:
+        return list(ex.map(lambda p: _gemini_text(p, temperature, model), prompts))
+
+def _gemini_text(prompt: str, temperature: float, model: str) -> str:
+    # サイドバーの「キャッシュを使わずに生成」が on なら、キャッシュを読まずに毎回生成し直す（結果はディスクに上書き）
+    if GEMINI_FRESH:
+        return _generate_gemini(prompt, temperature, model)
+    return _call_gemini_cached(prompt, temperature, model)
+
+def _gemini_cache_path(prompt: str, temperature: float, model: str) -> Path:
+    # キーは標準 json で固定（エンコーダの版や実装が変わってもファイル名が変わらない）
+    key = json.dumps([model, temperature, prompt], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return GEMINI_CACHE_DIR / f"{digest}.json"
+
+def _read_gemini_disk_cache(path: Path) -> str | None:
+    try:
+        if datetime.now().timestamp() - path.stat().st_mtime < GEMINI_CACHE_TTL:
+            return loads_json(path.read_bytes())["text"]
+        path.unlink()  # 期限切れはその場で消す
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+@st.cache_resource
+def prune_gemini_cache() -> int:
+    """期限切れのディスクキャッシュを消す（プロセス起動時に1回）。消したファイル数を返す"""
+    cutoff = datetime.now().timestamp() - GEMINI_CACHE_TTL
+    removed = 0
+    for f in GEMINI_CACHE_DIR.glob("*.json"):
+        try:
+            if f.stat().st_mtime < cutoff:
+                f.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def clear_gemini_cache() -> int:
+    """Gemini 応答のディスクキャッシュを消す。消したファイル数を返す"""
+    removed = 0
+    for f in GEMINI_CACHE_DIR.glob("*.json"):
+        try:
+            f.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+prune_gemini_cache()
+
+def _post_gemini(model: str, prompt: str, temperature: float, stream: bool = False) -> requests.Response:
+    """Gemini への送信は必ずここを通す（SESSION の Gemini 用アダプタ＝同じ再送ポリシーがかかる）。
+    stream=True なら streamGenerateContent（SSE）"""
+    if stream:
+        endpoint = f"{GEMINI_ORIGIN}/v1beta/models/{model}:streamGenerateContent?alt=sse&key={GEMINI_KEY}"
+    else:
+        endpoint = f"{GEMINI_ORIGIN}/v1beta/models/{model}:generateContent?key={GEMINI_KEY}"
     payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"temperature": temperature}}
-    r = requests.post(endpoint, json=payload, timeout=90)
+    return SESSION.post(endpoint, data=dumps_json(payload), headers=GEMINI_HEADERS,
+                        timeout=GEMINI_TIMEOUT, stream=stream)
+
+# 同一 (prompt, temperature, model) の再クリックは API を叩かず結果を返す（APIキーはキーに含めない）
+# キャッシュはディスクの1層だけ（GEMINI_CACHE_TTL）。再生成で上書きすれば次からその結果が返る
+def _call_gemini_cached(prompt: str, temperature: float, model: str) -> str:
+    cached = _read_gemini_disk_cache(_gemini_cache_path(prompt, temperature, model))
+    if cached is not None:
+        return cached
+    return _generate_gemini(prompt, temperature, model)
+
+def _generate_gemini(prompt: str, temperature: float, model: str) -> str:
+    """キャッシュを見ずに API で生成し、結果をディスクキャッシュに書く"""
+    r = _post_gemini(model, prompt, temperature)
     if r.status_code != 200:
         raise RuntimeError(f"Gemini エラー: {r.status_code} / {r.text[:500]}")
     j = r.json()
-    return j["candidates"][0]["content"]["parts"][0]["text"]
+    text = j["candidates"][0]["content"]["parts"][0]["text"]
+    try:
+        GEMINI_CACHE_DIR.mkdir(exist_ok=True)
+        _gemini_cache_path(prompt, temperature, model).write_bytes(dumps_json({"model": model, "text": text}))
+    except OSError:
+        pass  # キャッシュに書けなくても生成結果は返す
+    return text
+
+def stream_gemini(prompt: str, temperature: float = 0.2, model: str = "gemini-1.5-pro") -> Iterator[str]:
+    """streamGenerateContent（SSE）で届いた分から順にテキスト片を返す。長文生成の途中経過表示用（キャッシュしない）"""
+    if not GEMINI_KEY:
+        raise RuntimeError("Gemini APIキーが未設定です。Secrets に google.gemini_api_key_1 を追加してください。")
+    with _post_gemini(model, prompt, temperature, stream=True) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"Gemini エラー: {r.status_code} / {r.text[:500]}")
+        for line in r.iter_lines():
+            if not line.startswith(b"data:"):
+                continue
+            j = loads_json(line[5:])
+            for cand in j.get("candidates", [])[:1]:
+                for part in cand.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
 
 # 既存の関数はそのまま保持（バックアップ用）
-def generate_seo_title(keyword: str, content_dir: str) -> str:
-    """SEOタイトル生成（バックアップ用）"""
+def generate_seo_title(keyword: str, content_dir: str, model: str | None = None) -> str:
+    """SEOタイトル生成（バックアップ用）。model 省略時はサイドバーの選択モデル"""
     p = f"""
 # 役割: SEO編集者
 # 指示: 以下のキーワードから魅力的なSEOタイトルを生成
@@ -341,13 +767,13 @@ def generate_seo_title(keyword: str, content_dir: str) -> str:
 
 # 出力: タイトルのみ
 """
-    result = call_gemini(p, model=st.session_state.get("selected_model", "gemini-1.5-pro")).strip()
+    result = call_gemini(p, model=model or st.session_state.get("selected_model", "gemini-1.5-pro")).strip()
     # クリーニング
-    result = re.sub(r'[【】｜\n\r]', '', result)[:32]
+    result = result.translate(_TITLE_DELETE)[:32]
     return result
 
-def generate_seo_description(keyword: str, content_dir: str, title: str) -> str:
-    """メタディスクリプション生成（バックアップ用）"""
+def generate_seo_description(keyword: str, content_dir: str, title: str, model: str | None = None) -> str:
+    """メタディスクリプション生成（バックアップ用）。model 省略時はサイドバーの選択モデル"""
     p = f"""
 # 役割: SEO編集者
 # 指示: 以下の情報からメタディスクリプションを生成
@@ -365,34 +791,52 @@ def generate_seo_description(keyword: str, content_dir: str, title: str) -> str:
 
 # 出力: 説明文のみ
 """
-    result = call_gemini(p).strip()
+    result = call_gemini(p, model=model or st.session_state.get("selected_model", "gemini-1.5-pro")).strip()
     # クリーニング
-    result = re.sub(r'[\n\r]', '', result)[:120]
+    result = result.translate(_DESC_DELETE)[:120]
     return result
 
+def generate_title_and_description_parallel(keyword: str, content_dir: str, title_hint: str,
+                                            model: str) -> tuple[str, str]:
+    """タイトルと説明文を別リクエストで同時に生成（待ち時間は長い方の1回分）。
+    ワーカースレッドから session_state を触らないよう、model / title_hint は呼び出し側で確定させて渡す。"""
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_title = ex.submit(generate_seo_title, keyword, content_dir, model)
+        f_desc = ex.submit(generate_seo_description, keyword, content_dir, title_hint, model)
+        return f_title.result(), f_desc.result()
+
+def ensure_title_and_excerpt(keyword: str, content_dir: str, title: str, excerpt: str,
+                             model: str) -> tuple[str, str]:
+    """空欄のタイトル/説明文だけを生成して埋める（両方空なら並列で1往復分の待ち時間）"""
+    title, excerpt = title.strip(), excerpt.strip()
+    if not title and not excerpt:
+        return generate_title_and_description_parallel(keyword, content_dir, f"{keyword}について", model)
+    if not title:
+        title = generate_seo_title(keyword, content_dir, model)
+    if not excerpt:
+        excerpt = generate_seo_description(keyword, content_dir, title, model)
+    return title, excerpt
+
 
 # ------------------------------
 # プロンプト群（共起語対応）
 # ------------------------------
-def prompt_outline_123(keyword: str, extra: str, banned: List[str], co_terms: List[str], min_h2: int, max_h2: int) -> str:
-    banned_block = "\n".join([f"・{b}" for b in banned]) if banned else "（なし）"
-    co_block = "\n".join([f"・{w}" for w in co_terms]) if co_terms else "（指定なし）"
-    return f"""
+_OUTLINE_TMPL = string.Template("""
 # 役割
 あなたは日本語SEOに強いWeb編集者。キーワードから「①読者像」「②ニーズ」「③構成(HTML)」を作る。④は不要。
 
 # 入力
-- キーワード: {keyword}
-- 追加要素: {extra or "（指定なし）"}
+- キーワード: $keyword
+- 追加要素: $extra
 - 共起語（本文に自然に散りばめる想定 / 出力は③だけでOK）:
-{co_block}
+$co_block
 - 禁止事項（絶対に含めない）:
-{banned_block}
+$banned_block
 
 # 制約
 - ①/②は150字程度で箇条書き
 - ③は <h2>,<h3> のみ（<h1>禁止）
-- H2は最低 {min_h2} 個、最大 {max_h2} 個
+- H2は最低 $min_h2 個、最大 $max_h2 個
 - 各<h2>の下に<h3>は必ず3つ以上
 - H2直下で「この記事では〜」などの定型句は使わない（導入は後工程）
 
@@ -406,105 +850,232 @@ def prompt_outline_123(keyword: str, extra: str, banned: List[str], co_terms: Li
 ③ 構成（HTML）:
 <h2>...</h2>
 <h3>...</h3>
-""".strip()
+""".strip())
 
-def prompt_fill_h2(keyword: str, existing_structure_html: str, need: int) -> str:
+def prompt_outline_123(keyword: str, extra: str, banned: List[str], co_terms: List[str], min_h2: int, max_h2: int) -> str:
+    banned_block = "\n".join([f"・{b}" for b in banned]) if banned else "（なし）"
+    co_block = "\n".join([f"・{w}" for w in co_terms]) if co_terms else "（指定なし）"
+    return _OUTLINE_TMPL.substitute(
+        keyword=keyword,
+        extra=extra or "（指定なし）",
+        co_block=co_block,
+        banned_block=banned_block,
+        min_h2=min_h2,
+        max_h2=max_h2,
+    )
+
+OUTLINE_BATCH_SIZE = 6  # 1プロンプトに詰めるキーワード数（増やしすぎると出力が崩れやすい）
+
+def prompt_outline_batch(keywords: List[str], extra: str, banned: List[str], co_terms: List[str],
+                         min_h2: int, max_h2: int) -> str:
+    """複数キーワードの①〜③を1回で作らせる（JSON配列で受け取る）"""
+    kw_block = "\n".join([f"・{k}" for k in keywords])
+    banned_block = "\n".join([f"・{b}" for b in banned]) if banned else "（なし）"
+    co_block = "\n".join([f"・{w}" for w in co_terms]) if co_terms else "（指定なし）"
     return f"""
+# 役割
+あなたは日本語SEOに強いWeb編集者。複数のキーワードそれぞれについて「①読者像」「②ニーズ」「③構成(HTML)」を作る。
+
+# キーワード（{len(keywords)}件・この順で全件出力）
+{kw_block}
+
+# 共通入力
+- 追加要素: {extra or "（指定なし）"}
+- 共起語:
+{co_block}
+- 禁止事項（絶対に含めない）:
+{banned_block}
+
+# 制約（各キーワード共通）
+- readers / needs は150字程度で箇条書き（"- " 始まり・改行区切り）
+- structure_html は <h2>,<h3> のみ（<h1>禁止）
+- H2は最低 {min_h2} 個、最大 {max_h2} 個
+- 各<h2>の下に<h3>は必ず3つ以上
+
+# 出力（JSON配列のみ。前後に説明文を付けない）
+[{{"keyword": "...", "readers": "...", "needs": "...", "structure_html": "<h2>...</h2><h3>...</h3>"}}]
+""".strip()
+
+def parse_outline_batch(raw: str, keywords: List[str]) -> List[Dict[str, str]]:
+    """prompt_outline_batch の応答を keywords と同順の dict リストにする（欠けた分は空欄）"""
+    items: List[Any] = []
+    m = _JSON_ARRAY_RE.search(raw)
+    if m:
+        try:
+            items = loads_json(m.group(0))
+        except ValueError:
+            items = []
+    by_kw = {str(it.get("keyword", "")).strip(): it for it in items if isinstance(it, dict)}
+    out: List[Dict[str, str]] = []
+    for i, kw in enumerate(keywords):
+        it = by_kw.get(kw)
+        if it is None:
+            # 位置で当てるのは keyword 欄が無い要素だけ（別キーワードの構成を取り違えない。無ければ空欄＝生成失敗）
+            pos = items[i] if i < len(items) and isinstance(items[i], dict) else {}
+            it = pos if not str(pos.get("keyword") or "").strip() else {}
+        out.append({
+            "keyword": kw,
+            "readers": str(it.get("readers") or "").strip(),
+            "needs": str(it.get("needs") or "").strip(),
+            "structure_html": str(it.get("structure_html") or "").strip(),
+        })
+    return out
+
+def generate_outlines_bulk(keywords: List[str], extra: str, banned: List[str], co_terms: List[str],
+                           min_h2: int, max_h2: int, model: str) -> List[Dict[str, str]]:
+    """OUTLINE_BATCH_SIZE 件ずつ1プロンプトにまとめ、各まとまりは並列に投げる"""
+    groups = [keywords[i:i + OUTLINE_BATCH_SIZE] for i in range(0, len(keywords), OUTLINE_BATCH_SIZE)]
+    prompts = [prompt_outline_batch(g, extra, banned, co_terms, min_h2, max_h2) for g in groups]
+    results: List[Dict[str, str]] = []
+    for g, raw in zip(groups, call_gemini_many(prompts, model=model)):
+        for item in parse_outline_batch(raw, g):
+            if not item["structure_html"]:  # 応答から欠けたキーワードは空のまま（UIで失敗表示）
+                results.append(item)
+                continue
+            structure_html = simplify_html(item["structure_html"].replace("\r", ""))
+            structure_html = trim_h2_max(structure_html, max_h2)
+            item["structure_html"] = enforce_summary_last(structure_html, item["keyword"], max_h2)
+            results.append(item)
+    return results
+
+# 区分見出しは行頭の①②③のみ（「手順②で…」のような本文中の丸数字は見出し扱いしない）
+_OUTLINE_MARK_RE = re.compile(r'(?m)^[ \t]*(?:#+[ \t]*)?(?:\*\*)?([①②③])[^\n]*\n')
+
+def parse_outline(outline_raw: str) -> Tuple[str, str, str]:
+    """①読者像 / ②ニーズ / ③構成 を (readers, needs, structure_html) で返す（見出し行を1回走査して切り出す）"""
+    marks: Dict[str, re.Match] = {}
+    for m in _OUTLINE_MARK_RE.finditer(outline_raw):
+        marks.setdefault(m.group(1), m)
+    ordered = sorted(marks.values(), key=lambda m: m.start())
+    bodies: Dict[str, str] = {}
+    for i, m in enumerate(ordered):
+        # ③構成は末尾まで、それ以外は次の区分見出し行の直前まで
+        if m.group(1) == "③" or i + 1 == len(ordered):
+            end = len(outline_raw)
+        else:
+            end = ordered[i + 1].start()
+        bodies[m.group(1)] = outline_raw[m.end():end].strip()
+    return bodies.get("①", ""), bodies.get("②", ""), bodies.get("③", "")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def parse_outline_cached(outline_raw: str, max_h2: int) -> Tuple[str, str, str]:
+    """parse_outline + ③の整形（simplify_html / H2上限カット）まで。同じ生成結果なら再計算しない"""
+    readers, needs, structure_html = parse_outline(outline_raw)
+    structure_html = simplify_html(structure_html.replace("\r", ""))
+    return readers, needs, trim_h2_max(structure_html, max_h2)
+
+_FILL_H2_TMPL = string.Template("""
 # 役割: SEO編集者
-# 指示: 既存の構成（<h2>,<h3>）に不足があるため、追加のH2ブロックをちょうど {need} 個だけ作る。
+# 指示: 既存の構成（<h2>,<h3>）に不足があるため、追加のH2ブロックをちょうど $need 個だけ作る。
 # 厳守:
 - 出力は追加分のみ。前後の説明や余計な文章は出さない
 - 各ブロックは <h2>見出し</h2> の直後に <h3> を3つ以上
 - すべて日本語。<h1>は禁止。<br>は禁止
 
 # 既存の構成（参考・重複は避ける）
-{existing_structure_html}
+$existing_structure_html
 
 # 出力（追加分のみ）
-""".strip()
+""".strip())
 
-def prompt_full_article_unified(keyword: str,
-                                unified_policy_text: str,
-                                structure_html: str,
-                                readers_txt: str,
-                                needs_txt: str,
-                                banned: List[str],
-                                co_terms: List[str],
-                                min_chars: int,
-                                max_chars: int) -> str:
-    lead_pol, body_pol, summary_pol = extract_sections(unified_policy_text)
-    if not lead_pol:
-        lead_pol = """# リード文の作成指示:
+def prompt_fill_h2(keyword: str, existing_structure_html: str, need: int) -> str:
+    return _FILL_H2_TMPL.substitute(need=need, existing_structure_html=existing_structure_html)
+
+_DEFAULT_LEAD_POLICY = """# リード文の作成指示:
 ・読者の悩みや不安を共感的に表現すること
 ・記事で得られる具体的メリットを2つ以上
 ・最後に行動を促す一文
 """
-    if not summary_pol:
-        summary_pol = """# まとめ文の作成指示:
+
+_DEFAULT_SUMMARY_POLICY = """# まとめ文の作成指示:
 ・最初に<h2>{keyword}に関するまとめ</h2>
 ・要点を2-3個リストで挿入
 ・約300文字
 """
-    lead_pol = lead_pol.replace("{keyword}", keyword)
-    body_pol = body_pol.replace("{keyword}", keyword)
-    summary_pol = summary_pol.replace("{keyword}", keyword)
-    banned_block = "\n".join([f"・{b}" for b in banned]) if banned else "（なし）"
-    co_block = "\n".join([f"・{w}" for w in co_terms]) if co_terms else "（任意・無理に詰め込まない）"
-    return f"""
+
+# 定型部分は import 時に1度だけ組み立て、呼び出し時は差し込み枠だけ埋める
+_FULL_ARTICLE_TMPL = string.Template("""
 # 命令書:
 あなたはSEOに特化した日本語のプロライターです。
-以下の構成案と各ポリシーに従い、「{keyword}」の記事を
+以下の構成案と各ポリシーに従い、「$keyword」の記事を
 **リード文 → 本文 → まとめ**まで一気通貫でHTMLのみ出力してください。
 
 # 文字数ガイド（本文合計）
-・概ね {min_chars}〜{max_chars} 字に収めること
+・概ね $min_chars〜$max_chars 字に収めること
 
 # リード文ポリシー（厳守）
-{lead_pol}
+$lead_pol
 
 # 本文ポリシー（厳守）
-{body_pol}
+$body_pol
 
 # まとめ文ポリシー（厳守）
-{summary_pol}
+$summary_pol
 
 # 共起語（本文で“自然に”散りばめる・過度に詰め込み禁止）
-{co_block}
+$co_block
 
 # 禁止事項（絶対に含めない）
-{banned_block}
+$banned_block
 
 # 記事の方向性（参考）
 [読者像]
-{readers_txt}
+$readers_txt
 
 [ニーズ]
-{needs_txt}
+$needs_txt
 
 # 構成案（この<h2><h3>構成を厳密に守る）
-{structure_html}
+$structure_html
 
 # 出力
 （HTMLのみを出力）
-""".strip()
+""".strip())
+
+def prompt_full_article_unified(keyword: str,
+                                unified_policy_text: str,
+                                structure_html: str,
+                                readers_txt: str,
+                                needs_txt: str,
+                                banned: List[str],
+                                co_terms: List[str],
+                                min_chars: int,
+                                max_chars: int) -> str:
+    lead_pol, body_pol, summary_pol = extract_sections(unified_policy_text)
+    lead_pol = lead_pol or _DEFAULT_LEAD_POLICY
+    summary_pol = summary_pol or _DEFAULT_SUMMARY_POLICY
+    banned_block = "\n".join([f"・{b}" for b in banned]) if banned else "（なし）"
+    co_block = "\n".join([f"・{w}" for w in co_terms]) if co_terms else "（任意・無理に詰め込まない）"
+    return _FULL_ARTICLE_TMPL.substitute(
+        keyword=keyword,
+        min_chars=min_chars,
+        max_chars=max_chars,
+        lead_pol=lead_pol.replace("{keyword}", keyword),
+        body_pol=body_pol.replace("{keyword}", keyword),
+        summary_pol=summary_pol.replace("{keyword}", keyword),
+        co_block=co_block,
+        banned_block=banned_block,
+        readers_txt=readers_txt,
+        needs_txt=needs_txt,
+        structure_html=structure_html,
+    )
 
 # ------------------------------
 # タイトル/説明 & スラッグ
 # ------------------------------
-def generate_title_and_description_unified(keyword: str, content_dir: str) -> tuple[str, str]:
-    """タイトルとメタディスクリプションを1回で生成"""
-    p = f"""
+def prompt_title_and_description(keyword: str, content_dir: str) -> str:
+    return f"""
 # 役割: SEO編集者
-# 指示: 以下を同時に生成してください
+# 指示: 以下を同時に生成し、JSONオブジェクト1つだけを出力してください
 
-## 1. SEOタイトル
+## title（SEOタイトル）
 - 32文字以内
 - 日本語のみ
 - 【】や｜禁止
 - キーワードを自然に含める
 - クリックしたくなる魅力的な内容
 
-## 2. メタディスクリプション  
+## description（メタディスクリプション）
 - 120字以内
 - 定型「〜を解説/紹介」禁止
 - 数字や具体メリットを含める
@@ -514,52 +1085,63 @@ def generate_title_and_description_unified(keyword: str, content_dir: str) -> tu
 - キーワード: {keyword}
 - 方向性: {content_dir}
 
-# 出力フォーマット（厳守）
-タイトル: ここにタイトル
-説明: ここに説明文
-"""
-    result = call_gemini(p).strip()
-    
-    # 結果をパース
-    title_match = re.search(r'タイトル:\s*(.+)', result)
-    desc_match = re.search(r'説明:\s*(.+)', result)
-    
-    title = title_match.group(1).strip() if title_match else f"{keyword}について"
-    desc = desc_match.group(1).strip() if desc_match else f"{keyword}に関する情報をお届けします。"
-    
+# 出力フォーマット（厳守・JSONのみ／前後の説明文やコードブロック禁止）
+{{"title": "ここにタイトル", "description": "ここに説明文"}}
+""".strip()
+
+def generate_title_and_description_unified(keyword: str, content_dir: str) -> tuple[str, str]:
+    """タイトルとメタディスクリプションを1回で生成（JSONで受け取りローカルでパース）"""
+    result = call_gemini(prompt_title_and_description(keyword, content_dir),
+                         model=st.session_state.get("selected_model", "gemini-1.5-pro")).strip()
+
+    # 結果をパース（JSON部分のみ抽出。壊れていれば既定文にフォールバック）
+    data: Dict[str, Any] = {}
+    m = _JSON_OBJECT_RE.search(result)
+    if m:
+        try:
+            data = loads_json(m.group(0))
+        except ValueError:
+            data = {}
+
+    title = str(data.get("title") or "").strip() or f"{keyword}について"
+    desc = str(data.get("description") or "").strip() or f"{keyword}に関する情報をお届けします。"
+
     # クリーニング
-    title = re.sub(r'[【】｜\n\r]', '', title)[:32]
-    desc = re.sub(r'[\n\r]', '', desc)[:120]
-    
-    return title, desc
+    title = title.translate(_TITLE_DELETE)[:32]
+    desc = desc.translate(_DESC_DELETE)[:120]
 
+    return title, desc
 
-def generate_permalink(keyword_or_title: str) -> str:
-    import re as _re
-    from datetime import datetime as _dt
+@st.cache_resource
+def get_romaji_converter() -> Callable[[str], str]:
+    """日本語→ローマ字変換器（unidecode → pykakasi → 無変換 の順）。辞書ロードは初回のみ"""
     try:
         from unidecode import unidecode
-        def _jp_to_romaji(s: str) -> str:
-            return unidecode(s)
+        return unidecode
     except Exception:
-        try:
-            from pykakasi import kakasi
-            _kk = kakasi()
-            _kk.setMode("J", "a")
-            _conv = _kk.getConverter()
-            def _jp_to_romaji(s: str) -> str:
-                return _conv.do(s)
-        except Exception:
-            def _jp_to_romaji(s: str) -> str:
-                return s
+        pass
+    try:
+        from pykakasi import kakasi
+        _kk = kakasi()
+        _kk.setMode("J", "a")
+        return _kk.getConverter().do
+    except Exception:
+        return lambda s: s
+
+_SLUG_SYMBOLS = str.maketrans({"&": " and ", "+": " plus "})
+
+def generate_permalink(keyword_or_title: str) -> str:
     s = (keyword_or_title or "").strip()
-    if not s:
-        return f"post-{int(_dt.now().timestamp())}"
-    s = _jp_to_romaji(s).lower()
-    s = s.replace("&", " and ").replace("+", " plus ")
-    s = _re.sub(r"[^a-z0-9\s-]", "", s)
-    s = _re.sub(r"\s+", "-", s)
-    s = _re.sub(r"-{2,}", "-", s).strip("-")
+    # 時刻フォールバックはキャッシュの外で作る（同じスラッグを使い回さない）
+    return (_slugify_cached(s) if s else "") or f"post-{int(datetime.now().timestamp())}"
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _slugify_cached(s: str) -> str:
+    s = get_romaji_converter()(s).lower()
+    s = s.translate(_SLUG_SYMBOLS)
+    s = _SLUG_DROP_RE.sub("", s)
+    s = _SPACES_RE.sub("-", s)
+    s = _DASHES_RE.sub("-", s).strip("-")
     if len(s) > 50:
         parts = s.split("-")
         out = []
@@ -570,7 +1152,7 @@ def generate_permalink(keyword_or_title: str) -> str:
                 break
             out.append(p)
         s = "-".join(out) or s[:50]
-    return s or f"post-{int(_dt.now().timestamp())}"
+    return s
 
 # ------------------------------
 # ポリシー（統合）管理
@@ -619,31 +1201,64 @@ DEFAULT_POLICY_TXT = """[リード文]
 """
 
 SECTION_MARKERS = ("[リード文]", "[本文指示]", "[まとめ文]")
+_SECTION_LABELS = frozenset(m[1:-1] for m in SECTION_MARKERS)
+_BRACKET_RE = re.compile(r"\[([^\[\]\n]+)\]")  # 閉じ忘れの "[" が次の見出しを飲み込まないよう、"[" と改行はまたがない
 
 def extract_sections(policy_text: str) -> Tuple[str, str, str]:
-    def _find(label: str) -> str:
-        m = re.search(rf"\[{label}\](.*?)(?=\[[^\]]+\]|$)", policy_text, flags=re.DOTALL)
-        return (m.group(1).strip() if m else "")
-    if not any(x in policy_text for x in SECTION_MARKERS):
+    # [見出し] を1回だけ走査し、各区分は「次の [..] まで」を本文とする（同じ区分が複数あれば最初のもの）
+    found: Dict[str, str] = {}
+    pending: str | None = None
+    start = 0
+    for m in _BRACKET_RE.finditer(policy_text):
+        if pending is not None:
+            found.setdefault(pending, policy_text[start:m.start()].strip())
+            pending = None
+        if m.group(1) in _SECTION_LABELS:
+            pending, start = m.group(1), m.end()
+    if pending is not None:
+        found.setdefault(pending, policy_text[start:].strip())
+    if not found:
         return "", policy_text.strip(), ""
-    return _find("リード文"), _find("本文指示"), _find("まとめ文")
+    return found.get("リード文", ""), found.get("本文指示", ""), found.get("まとめ文", "")
 
 # ------------------------------
 # キャッシュ I/O（統合テキストをそのまま保存）
 # ------------------------------
+@st.cache_data(max_entries=1, show_spinner=False)
+def _read_policy_cache(mtime: float) -> Dict[str, Any]:
+    # mtime をキーにして、ファイルが更新されたときだけ読み直す
+    return loads_json(CACHE_PATH.read_bytes())
+
 def load_policies_from_cache() -> Dict[str, Any] | None:
     try:
         if CACHE_PATH.exists():
-            with open(CACHE_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return _read_policy_cache(CACHE_PATH.stat().st_mtime)
     except Exception as e:
         st.warning(f"ポリシーキャッシュ読込エラー: {e}")
     return None
 
 def save_policies_to_cache(store: Dict[str, str], active_name: str):
+    # 前回このセッションで書いた内容と同じで、ファイルも書いた時のままなら書かない
+    digest = hash((tuple(sorted(store.items())), active_name))
+    last = st.session_state.get("_policy_cache_written")
     try:
-        with open(CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump({"policy_store": store, "active_policy": active_name}, f, ensure_ascii=False, indent=2)
+        if last and last[0] == digest and CACHE_PATH.exists() and CACHE_PATH.stat().st_mtime == last[1]:
+            return
+        # 一時ファイルに書いてから置き換える（書き込み途中で落ちても既存キャッシュを壊さない）。
+        # 一時ファイル名は毎回一意にする（複数セッションが同時に保存しても互いの書きかけを掴まない）
+        with tempfile.NamedTemporaryFile(dir=CACHE_PATH.parent, prefix=CACHE_PATH.name, suffix=".tmp",
+                                         delete=False) as tmp:
+            try:
+                tmp.write(dumps_json({"policy_store": store, "active_policy": active_name}, indent=True))
+                tmp.close()
+                # NamedTemporaryFile は 0600 で作られる。置き換えで既存キャッシュの権限が変わらないようにそろえる
+                os.chmod(tmp.name, CACHE_PATH.stat().st_mode & 0o777 if CACHE_PATH.exists() else 0o644)
+                os.replace(tmp.name, CACHE_PATH)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        st.session_state["_policy_cache_written"] = (digest, CACHE_PATH.stat().st_mtime)
     except Exception as e:
         st.warning(f"ポリシーキャッシュ保存エラー: {e}")
 
@@ -653,13 +1268,46 @@ def save_policies_to_cache(store: Dict[str, str], active_name: str):
 st.sidebar.header("接続先（WP）")
 site_key = st.sidebar.selectbox("投稿先サイト", sorted(WP_CONFIGS.keys()))
 cfg = WP_CONFIGS[site_key]
-BASE = ensure_trailing_slash(cfg["url"])
-AUTH = HTTPBasicAuth(cfg["user"], cfg["password"])
+BASE, AUTH = wp_client(site_key)
+DEBUG_HTTP = st.sidebar.checkbox("Debug HTTP", value=False)
+_http_log_box = st.sidebar.empty()
+
+def flush_http_log() -> None:
+    """この rerun 中の WP 呼び出し履歴を1ブロックで表示（スクリプト末尾で呼ぶ）"""
+    if DEBUG_HTTP:
+        _http_log_box.code("\n".join(_HTTP_LOG) or "（この実行では WP への呼び出しなし）")
+
+@st.cache_data(ttl=30, show_spinner=False)
+def check_auth(base: str, user: str, _auth: HTTPBasicAuth) -> Tuple[int | None, str]:
+    """users/me の疎通確認。連打しても 30 秒間は同じ結果を返す（キーに password は含めない）"""
+    r = wp_get(base, "wp/v2/users/me", _auth, HEADERS)
+    if r is None:
+        return None, "No response"
+    return r.status_code, r.text[:300]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_categories_cached(base_url: str, user: str, _auth: HTTPBasicAuth) -> List[Tuple[str, int]]:
+    # 失敗は例外で抜ける（st.cache_data は例外を保存しないので、空リストを5分間使い回さない）
+    r = wp_get(base_url, "wp/v2/categories?per_page=100&_fields=id,name", _auth, HEADERS)
+    if r is None or r.status_code != 200:
+        raise RuntimeError(f"categories: {r.status_code if r is not None else 'N/A'}")
+    pairs = [(c.get("name", "(no name)"), int(c.get("id"))) for c in r.json() if c.get("id") is not None]
+    return sorted(pairs, key=lambda x: x[0])
+
+def fetch_categories(base_url: str, user: str, auth: HTTPBasicAuth) -> List[Tuple[str, int]]:
+    """REST からカテゴリー一覧。成功結果は 5 分間使い回す（キーに password は含めない）"""
+    try:
+        return _fetch_categories_cached(base_url, user, auth)
+    except Exception:
+        return []
+
+if st.sidebar.button("🔄 カテゴリーを再取得"):
+    _fetch_categories_cached.clear()
 
 if st.sidebar.button("🔐 認証 /users/me"):
-    r = wp_get(BASE, "wp/v2/users/me", AUTH, HEADERS)
-    st.sidebar.code(f"GET users/me → {r.status_code if r else 'N/A'}")
-    st.sidebar.caption((r.text[:300] if r is not None else "No response"))
+    status, text = check_auth(BASE, cfg["user"], AUTH)
+    st.sidebar.code(f"GET users/me → {status if status is not None else 'N/A'}")
+    st.sidebar.caption(text)
 
 # ここに追加：モデル選択UI
 st.sidebar.header("🤖 AIモデル選択")
@@ -679,6 +1327,11 @@ else:
     st.session_state["selected_model"] = "gemini-1.5-flash"  
     st.sidebar.info("⚡ Flash選択中\n約1.6円/記事（94%削減）")
 
+GEMINI_FRESH = st.sidebar.checkbox("🔁 キャッシュを使わずに生成", value=False,
+                                   help="オンの間は同じ入力でも毎回 Gemini で生成し直します（結果はキャッシュを上書き）")
+if st.sidebar.button("🧹 生成キャッシュを削除"):
+    st.sidebar.caption(f"Gemini 応答キャッシュを削除しました（{clear_gemini_cache()}件）。")
+
 st.sidebar.markdown("---")  # 区切り線
 
 # ------------------------------
@@ -690,14 +1343,17 @@ if "policy_store" not in st.session_state or not isinstance(st.session_state.pol
 if "active_policy" not in st.session_state:
     st.session_state.active_policy = DEFAULT_PRESET_NAME
 
-cached = load_policies_from_cache()
-if cached:
-    cache_store = cached.get("policy_store")
-    if isinstance(cache_store, dict) and cache_store:
-        st.session_state.policy_store = cache_store
-    ap = cached.get("active_policy")
-    if ap in st.session_state.policy_store:
-        st.session_state.active_policy = ap
+# ローカルキャッシュの反映はセッション開始時（F5 直後）の1回だけ
+if not st.session_state.get("_policies_loaded"):
+    cached = load_policies_from_cache()
+    if cached:
+        cache_store = cached.get("policy_store")
+        if isinstance(cache_store, dict) and cache_store:
+            st.session_state.policy_store = cache_store
+        ap = cached.get("active_policy")
+        if ap in st.session_state.policy_store:
+            st.session_state.active_policy = ap
+    st.session_state["_policies_loaded"] = True
 
 if DEFAULT_PRESET_NAME not in st.session_state.policy_store:
     st.session_state.policy_store[DEFAULT_PRESET_NAME] = DEFAULT_POLICY_TXT
@@ -709,6 +1365,27 @@ st.session_state.setdefault("policy_text", cur_txt)
 st.session_state.setdefault("banned_text", "")
 st.session_state.setdefault("co_terms_text", "")  # 共起語入力
 
+# ------------------------------
+# プレビュー（iframe 描画で markdown 変換を通さない。属性は落としてから渡す）
+# ------------------------------
+def render_preview(assembled: str, co_terms: List[str]) -> None:
+    st.markdown("#### 👀 プレビュー（一括生成結果）")
+    # 描画を省けるのは出さないときだけ（出さなかった要素は rerun で消える）。
+    # オフにすれば、左の入力を触るたびに本文 iframe を送り直さずに済む（検査結果は出し続ける）
+    if st.toggle("プレビューを表示", value=True, key="show_preview"):
+        components.html(preview_safe_html_cached(assembled), height=800, scrolling=True)
+    issues = validate_article_cached(assembled)
+
+    # 共起語の出現チェック（大小無視・単純包含）
+    if co_terms:
+        plain = strip_tags(assembled).lower()
+        missing = [w for w in co_terms if w.lower() not in plain]
+        if missing:
+            issues.append(f"共起語が本文に見当たりません：{', '.join(missing)}")
+
+    if issues:
+        st.warning("検査結果:\n- " + "\n- ".join(issues))
+
 # ==============================
 # 3カラム：入力 / 生成&プレビュー / 投稿
 # ==============================
@@ -728,7 +1405,7 @@ with colL:
     co_terms: List[str] = []
     if co_terms_text.strip():
         # カンマと改行の両対応→重複/空白除去
-        raw_list = re.split(r"[,\n\r]+", co_terms_text)
+        raw_list = _CO_TERMS_SPLIT_RE.split(co_terms_text)
         co_terms = sorted({w.strip() for w in raw_list if w.strip()})
 
     st.markdown("### 🚫 禁止事項（任意_1行=1項目）")
@@ -740,8 +1417,13 @@ with colL:
     st.subheader("④ 文章ポリシー（統合 .txt）")
 
     pol_files = st.file_uploader("policy*.txt（複数可）を読み込む", type=["txt"], accept_multiple_files=True)
-    if pol_files:
-        for f in pol_files:
+    # アップローダーは rerun ごとに同じファイルを返すので、未取り込みのものだけ処理する
+    # （file_id はアップロードごとに変わる。同じファイルを選び直した場合も取り込み直す）
+    seen_uploads = st.session_state.setdefault("_seen_policy_uploads", set())
+    new_files = [f for f in (pol_files or []) if f.file_id not in seen_uploads]
+    if new_files:
+        for f in new_files:
+            seen_uploads.add(f.file_id)
             try:
                 raw = f.read().decode("utf-8", errors="ignore").strip()
                 name = f.name.rsplit(".", 1)[0]
@@ -834,17 +1516,9 @@ with colM:
             model=st.session_state.get("selected_model", "gemini-1.5-pro")
         )
 
-        readers = re.search(r'①[^\n]*\n(.+?)\n\n②', outline_raw, flags=re.DOTALL)
-        needs = re.search(r'②[^\n]*\n(.+?)\n\n③', outline_raw, flags=re.DOTALL)
-        struct = re.search(r'③[^\n]*\n(.+)$', outline_raw, flags=re.DOTALL)
-
-        st.session_state["readers"] = (readers.group(1).strip() if readers else "")
-        st.session_state["needs"] = (needs.group(1).strip() if needs else "")
-        structure_html = (struct.group(1).strip() if struct else "").replace("\r", "")
-        structure_html = simplify_html(structure_html)
-
-        if count_h2(structure_html) > max_h2:
-            structure_html = trim_h2_max(structure_html, max_h2)
+        readers, needs, structure_html = parse_outline_cached(outline_raw, max_h2)
+        st.session_state["readers"] = readers
+        st.session_state["needs"] = needs
 
         current_h2 = count_h2(structure_html)
         if current_h2 < min_h2:
@@ -855,8 +1529,7 @@ with colM:
             if count_h2(add) > 0:
                 structure_html = (structure_html.rstrip() + "\n\n" + add.strip())
 
-        if count_h2(structure_html) > max_h2:
-            structure_html = trim_h2_max(structure_html, max_h2)
+        structure_html = trim_h2_max(structure_html, max_h2)
       # --- ここから追加：最後のH2を必ず「まとめ」に固定する ---
         # ユーザーの min/max は「総H2数（= まとめ含む）」として扱う。
         # ③では本文用H2のみ(total_h2-1)を確定させ、最後の1枠をまとめに予約する。
@@ -866,6 +1539,28 @@ with colM:
 
         st.session_state["structure_html"] = structure_html
 
+    # 複数キーワードの①〜③（数件ずつ1プロンプトにまとめ、まとまり同士は並列）
+    with st.expander("📦 キーワードを貼り付けて①〜③を一括生成", expanded=False):
+        bulk_text = st.text_area("キーワード（改行またはカンマ区切り）", height=100, key="bulk_keywords")
+        if st.button("一括生成", use_container_width=True):
+            bulk_keywords = list(dict.fromkeys(w.strip() for w in _CO_TERMS_SPLIT_RE.split(bulk_text) if w.strip()))
+            if not bulk_keywords:
+                st.warning("キーワードを1件以上入力してください。")
+            else:
+                with st.spinner(f"{len(bulk_keywords)}件の①〜③を生成中..."):
+                    st.session_state["bulk_outlines"] = generate_outlines_bulk(
+                        bulk_keywords, extra_points, merged_banned, co_terms, min_h2, max_h2,
+                        st.session_state.get("selected_model", "gemini-1.5-pro"),
+                    )
+        for i, item in enumerate(st.session_state.get("bulk_outlines", [])):
+            ok = bool(item["structure_html"])
+            st.markdown(f"**{item['keyword']}** — H2: {count_h2(item['structure_html'])}" + ("" if ok else "（生成失敗）"))
+            if ok and st.button("この①〜③を編集欄に読み込む", key=f"bulk_use_{i}"):
+                st.session_state["readers"] = item["readers"]
+                st.session_state["needs"] = item["needs"]
+                st.session_state["structure_html"] = item["structure_html"]
+                st.info(f"『{item['keyword']}』の①〜③を読み込みました。キーワード欄も合わせて変更してください。")
+
     # 手直し
     readers_txt = st.text_area("① 読者像（編集可）", value=st.session_state.get("readers", ""), height=110)
     needs_txt = st.text_area("② ニーズ（編集可）", value=st.session_state.get("needs", ""), height=110)
@@ -878,7 +1573,12 @@ with colM:
         if not structure_html.strip():
             st.error("③構成（HTML）が必要です。①〜③を生成し、必要なら編集してください。"); st.stop()
 
-        full = call_gemini(
+        # Gemini の生成待ちの間に、後の投稿で使う WP 接続を裏で温めておく（完了は待たない）
+        # 本文は届いた分から下書き表示する（全文の完成を待たない）
+        live = st.empty()
+        chunks: List[str] = []
+        prewarm_wp(BASE, AUTH, HEADERS)
+        for chunk in stream_gemini(
             prompt_full_article_unified(
                 keyword=keyword,
                 unified_policy_text=st.session_state.policy_text,
@@ -891,10 +1591,15 @@ with colM:
                 max_chars=max_chars
             ),
             model=st.session_state.get("selected_model", "gemini-1.5-pro")
-        )
-        full = simplify_html(full)
+        ):
+            chunks.append(chunk)
+            # 整形前のモデル出力なので、プレビューと同じく属性なしの許可タグだけにしてから表示する
+            live.markdown(preview_safe_html("".join(chunks)), unsafe_allow_html=True)
+        live.empty()
+        full = simplify_html("".join(chunks))
         st.session_state["assembled_html"] = full
         st.session_state["edited_html"] = full
+        st.session_state["html_clean"] = True  # 生成直後は整形済み（投稿時の再整形を省く）
         st.session_state["use_edited"] = True
 
         html_cur = st.session_state.get("edited_html", "")
@@ -943,32 +1648,25 @@ with colM:
     # プレビュー & 編集
     assembled = st.session_state.get("assembled_html", "")
     if assembled:
-        st.markdown("#### 👀 プレビュー（一括生成結果）")
-        st.write(assembled, unsafe_allow_html=True)
-        issues = validate_article(assembled)
-
-        # 共起語の出現チェック（大小無視・単純包含）
-        if co_terms:
-            plain = re.sub(r'<.*?>', '', assembled).lower()
-            missing = [w for w in co_terms if w.lower() not in plain]
-            if missing:
-                issues.append(f"共起語が本文に見当たりません：{', '.join(missing)}")
-
-        if issues:
-            st.warning("検査結果:\n- " + "\n- ".join(issues))
+        render_preview(assembled, co_terms)
 
     with st.expander("✏️ プレビューを編集（この内容を下書きに送付）", expanded=False):
         st.caption("※ ここでの修正が最終本文になります。HTMLで編集可。")
-        st.session_state["edited_html"] = st.text_area(
+        edited = st.text_area(
             "編集用HTML",
             value=st.session_state.get("edited_html", assembled),
             height=420
         )
+        if edited != st.session_state.get("edited_html"):
+            st.session_state["html_clean"] = False  # 手編集が入ったら投稿時に再整形する
+        st.session_state["edited_html"] = edited
         st.session_state["use_edited"] = st.checkbox("編集したHTMLを採用する", value=True)
 
 # ------ 右：タイトル/説明 → 投稿 ------
 # ------ 右：タイトル/説明 → 投稿 ------
-with colR:
+@st.fragment
+def render_publish_column(keyword: str) -> None:
+    """タイトル/説明 → 投稿。ここの入力・ボタン操作ではこの関数だけが再実行される"""
     st.header("3) タイトル/説明 → 投稿")
 
     content_dir = (st.session_state.get("readers", "") + "\n" +
@@ -977,7 +1675,7 @@ with colR:
     content_source = st.session_state.get("edited_html") or st.session_state.get("assembled_html", "")
 
     # 統合生成ボタン
-    if st.button("📝 SEOタイトル・説明文を自動生成", use_container_width=True):
+    if st.button("📝 SEOタイトル/説明を生成", use_container_width=True):
         if not content_source.strip():
             st.warning("先に本文（編集後）を用意してください。")
         else:
@@ -989,6 +1687,19 @@ with colR:
 
     # 個別生成ボタン（バックアップ）
     with st.expander("🔧 個別生成（統合版で上手くいかない場合）", expanded=False):
+        if st.button("タイトル+説明を同時生成（並列）", use_container_width=True):
+            if not content_source.strip():
+                st.warning("先に本文を用意してください。")
+            else:
+                with st.spinner("タイトルと説明文を並列生成中..."):
+                    t, d = generate_title_and_description_parallel(
+                        keyword, content_dir,
+                        st.session_state.get("title", "") or f"{keyword}について",
+                        st.session_state.get("selected_model", "gemini-1.5-pro"),
+                    )
+                st.session_state["title"] = t
+                st.session_state["excerpt"] = d
+                st.success("タイトルと説明文を生成しました。")
         col1, col2 = st.columns(2)
         with col1:
             if st.button("タイトルのみ生成"):
@@ -1011,17 +1722,6 @@ with colR:
     excerpt = st.text_area("ディスクリプション（抜粋）", value=st.session_state.get("excerpt", ""), height=80)
 
     # ▼ カテゴリーUI（Secrets→wp_categories→REST）
-    def fetch_categories(base_url: str, auth: HTTPBasicAuth) -> List[Tuple[str, int]]:
-        try:
-            r = wp_get(base_url, "wp/v2/categories?per_page=100&_fields=id,name", auth, HEADERS)
-            if r is not None and r.status_code == 200:
-                data = r.json()
-                pairs = [(c.get("name", "(no name)"), int(c.get("id"))) for c in data if c.get("id") is not None]
-                return sorted(pairs, key=lambda x: x[0])
-        except Exception:
-            pass
-        return []
-
     cfg_cats_map: Dict[str, int] = dict(cfg.get("categories", {}))
     cats: List[Tuple[str, int]] = []
     if cfg_cats_map:
@@ -1031,7 +1731,7 @@ with colR:
         if sc_map:
             cats = sorted([(name, int(cid)) for name, cid in sc_map.items()], key=lambda x: x[0])
         else:
-            cats = fetch_categories(BASE, AUTH)
+            cats = fetch_categories(BASE, cfg["user"], AUTH)
 
     cat_labels = [name for (name, _cid) in cats]
     sel_labels: List[str] = st.multiselect("カテゴリー（複数可）", cat_labels, default=[])
@@ -1047,23 +1747,34 @@ with colR:
     sched_time = st.time_input("予約時刻（future用）", value=dt_time(9, 0))
 
     # 投稿
-    if st.button("📝 WPに下書き/投稿する", type="primary", use_container_width=True):
+    post_clicked = st.button("📝 WPに下書き/投稿する", type="primary", use_container_width=True)
+    queue_clicked = st.button("➕ 一括投稿キューに追加", use_container_width=True)
+    if post_clicked or queue_clicked:
         if not keyword.strip():
-            st.error("キーワードは必須です。"); st.stop()
-        if not title.strip():
-            st.error("タイトルは必須です。"); st.stop()
+            st.error("キーワードは必須です。"); return
 
         content_html = (st.session_state.get("edited_html") if st.session_state.get("use_edited")
                         else st.session_state.get("assembled_html", "")).strip()
         if not content_html:
-            st.error("本文が未生成です。『①〜③生成→記事を一括生成』の順で作成してください。"); st.stop()
-
-        content_html = simplify_html(content_html)
+            st.error("本文が未生成です。『①〜③生成→記事を一括生成』の順で作成してください。"); return
+
+        # タイトル/説明が空なら、ここで足りない分だけ生成する
+        if not title.strip() or not excerpt.strip():
+            with st.spinner("未入力のタイトル/説明文を生成中..."):
+                title, excerpt = ensure_title_and_excerpt(
+                    keyword, content_dir, title, excerpt,
+                    st.session_state.get("selected_model", "gemini-1.5-pro"),
+                )
+            st.session_state["title"] = title
+            st.session_state["excerpt"] = excerpt
+            st.info(f"タイトル/説明文を自動生成しました：{title}")
+
+        if not st.session_state.get("html_clean"):
+            content_html = simplify_html_cached(content_html)
 
         date_gmt = None
         if status == "future":
-            from datetime import datetime as _dt
-            dt_local = _dt.combine(sched_date, sched_time)
+            dt_local = datetime.combine(sched_date, sched_time).replace(tzinfo=SCHEDULE_TZ)
             date_gmt = dt_local.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
 
         # スラッグ決定
@@ -1083,15 +1794,54 @@ with colR:
         if selected_cat_ids:
             payload["categories"] = selected_cat_ids
 
-        r = wp_post(BASE, "wp/v2/posts", AUTH, HEADERS, json_payload=payload)
-        if r is None or r.status_code not in (200, 201):
-            st.error(f"投稿失敗: {r.status_code if r else 'N/A'}")
-            if r is not None:
-                st.code(r.text[:1000])
-            st.stop()
+        if queue_clicked:
+            st.session_state.setdefault("pending_posts", []).append(payload)
+            st.success(f"キューに追加しました（{len(st.session_state['pending_posts'])}件待機中）。")
+        else:
+            log_start = len(_HTTP_LOG)
+            r = wp_post(BASE, "wp/v2/posts", AUTH, HEADERS, json_payload=payload)
+            if DEBUG_HTTP:  # フラグメント内の再実行ではサイドバーを更新できないので、ここに出す
+                st.code("\n".join(_HTTP_LOG[log_start:]))
+            if r is None or r.status_code not in (200, 201):
+                st.error(f"投稿失敗: {r.status_code if r else 'N/A'}")
+                if r is not None:
+                    st.code(r.text[:1000])
+                return
+
+            data = r.json()
+            st.success(f"投稿成功！ID={data.get('id')} / status={data.get('status')}")
+            st.write("URL:", data.get("link", ""))
+            st.json({k: data.get(k) for k in ["id", "slug", "status", "date", "link"]})
+
+    # 一括投稿（batch/v1 で最大25件ずつ1リクエスト）
+    pending: List[Dict[str, Any]] = st.session_state.get("pending_posts", [])
+    if pending:
+        st.caption("一括投稿キュー：" + " / ".join(p["title"] for p in pending))
+        cQ1, cQ2 = st.columns(2)
+        with cQ1:
+            batch_clicked = st.button(f"🚀 一括投稿（{len(pending)}件）", use_container_width=True)
+        with cQ2:
+            if st.button("キューを空にする", use_container_width=True):
+                st.session_state["pending_posts"] = []
+                st.rerun(scope="fragment")
+        if batch_clicked:
+            log_start = len(_HTTP_LOG)
+            with st.spinner("一括投稿中..."):
+                results = wp_batch_post(BASE, AUTH, HEADERS, pending)
+            if DEBUG_HTTP:
+                st.code("\n".join(_HTTP_LOG[log_start:]))
+            failed: List[Dict[str, Any]] = []
+            for p, (code, body) in zip(pending, results):
+                if code in (200, 201):
+                    st.success(f"投稿成功：{p['title']}（ID={body.get('id')} / status={body.get('status')}）")
+                else:
+                    failed.append(p)
+                    msg = body.get("message", "") if isinstance(body, dict) else "他の記事の検証エラーにより未送信"
+                    st.error(f"投稿失敗：{p['title']}（{code if code is not None else 'N/A'}）{msg}")
+            # 失敗分だけキューに残して再送できるようにする
+            st.session_state["pending_posts"] = failed
 
-        data = r.json()
-        st.success(f"投稿成功！ID={data.get('id')} / status={data.get('status')}")
-        st.write("URL:", data.get("link", ""))
-        st.json({k: data.get(k) for k in ["id", "slug", "status", "date", "link"]})
+with colR:
+    render_publish_column(keyword)
 
+flush_http_log()
@@ -0,0 +1,252 @@
+"""streamlit_app.py の純粋なテキスト処理ヘルパーの回帰テスト。
+
+アプリ本体は import すると Streamlit の画面構築まで走るため、
+必要な定数・関数の定義だけを AST から取り出して実行する。
+"""
+from __future__ import annotations
+
+import ast
+import random
+import re
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+APP_PATH = Path(__file__).resolve().parent.parent / "streamlit_app.py"
+
+
+def load_defs(*names: str) -> Dict[str, Any]:
+    tree = ast.parse(APP_PATH.read_text(encoding="utf-8"))
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in names:
+            node.decorator_list = []
+            nodes.append(node)
+        elif isinstance(node, ast.Import) and any(a.name in names for a in node.names):
+            nodes.append(node)
+        elif isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id in names for t in node.targets):
+            nodes.append(node)
+    ns: Dict[str, Any] = {"re": re, "Any": Any, "Dict": Dict, "List": List, "Tuple": Tuple}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), str(APP_PATH), "exec"), ns)
+    return ns
+
+
+# 走査版に置き換える前の正規表現実装（結果が変わっていないことの比較用）
+def _old_split_p_chunks(html):
+    return re.findall(r'(?si).*?(?:<p>.*?</p>|$)', html)
+
+
+def _old_validate_article(html):
+    warns = []
+    if re.search(r'<h4|<script|<style', html, flags=re.IGNORECASE):
+        warns.append("禁止タグ（h4/script/style）が含まれています。")
+    if re.search(r'<br\s*/?>', html, flags=re.IGNORECASE):
+        warns.append("<br> タグは使用禁止です。すべて <p> に置き換えてください。")
+    h2_iter = list(re.finditer(r'(<h2>.*?</h2>)', html, flags=re.DOTALL | re.IGNORECASE))
+    for i, m in enumerate(h2_iter):
+        end = h2_iter[i + 1].start() if i + 1 < len(h2_iter) else len(html)
+        if not re.search(r'<(ul|ol|table)\b', html[m.end():end], flags=re.IGNORECASE):
+            warns.append("H2セクションに表（table）または箇条書き（ul/ol）が不足しています。")
+    for m in re.finditer(r'(<h3>.*?</h3>)', html, flags=re.DOTALL | re.IGNORECASE):
+        next_head = re.search(r'(<h2>|<h3>)', html[m.end():], flags=re.IGNORECASE)
+        end = m.end() + next_head.start() if next_head else len(html)
+        p_count = len(re.findall(r'<p>.*?</p>', html[m.end():end], flags=re.DOTALL | re.IGNORECASE))
+        if p_count < 3 or p_count > 6:
+            warns.append("各<h3>直下は4〜5文（<p>）が目安です。分量を調整してください。")
+    if len(re.sub(r'<.*?>', '', html).strip()) > 6000:
+        warns.append("記事全体が6000文字を超えています。要約・整理してください。")
+    return warns
+
+
+def _old_trim_h2_max(structure_html, max_count):
+    h2_re = re.compile(r'(<h2>.*?</h2>)', re.IGNORECASE | re.DOTALL)
+    parts = h2_re.split(structure_html)
+    out = []
+    h2_seen = 0
+    i = 0
+    while i < len(parts):
+        if h2_re.match(parts[i] or ""):
+            h2_seen += 1
+            if h2_seen <= max_count:
+                out.append(parts[i])
+                if i + 1 < len(parts):
+                    out.append(parts[i + 1])
+            i += 2
+            continue
+        if h2_seen == 0:
+            out.append(parts[i])
+        i += 1
+    return "".join(out)
+
+
+def _random_html(rng, tokens, max_len):
+    return "".join(rng.choice(tokens) for _ in range(rng.randint(0, max_len)))
+
+
+class StripTagsTest(unittest.TestCase):
+    def setUp(self):
+        self.strip_tags = load_defs("strip_tags")["strip_tags"]
+
+    def test_basic(self):
+        self.assertEqual(self.strip_tags("<h2>見出し</h2><p>本文</p>"), "見出し本文")
+
+    def test_tag_does_not_span_lines_by_default(self):
+        self.assertEqual(self.strip_tags("x<y\n<p>z</p>"), "x<y\nz")
+
+    def test_multiline(self):
+        self.assertEqual(self.strip_tags("x<y\n<p>z</p>", multiline=True), "xz")
+        self.assertEqual(self.strip_tags("a<b", multiline=True), "a<b")
+
+    def test_matches_regex(self):
+        rng = random.Random(0)
+        for _ in range(20000):
+            s = _random_html(rng, "<>\nab", 14)
+            self.assertEqual(self.strip_tags(s), re.sub(r'<.*?>', '', s), s)
+            self.assertEqual(self.strip_tags(s, multiline=True), re.sub(r'<.*?>', '', s, flags=re.DOTALL), s)
+
+
+class SplitPChunksTest(unittest.TestCase):
+    def setUp(self):
+        self.split = load_defs("split_p_chunks")["split_p_chunks"]
+
+    def test_chunks(self):
+        self.assertEqual(self.split("a<p>1</p>b<P>2</P>c"), ["a<p>1</p>", "b<P>2</P>", "c", ""])
+        self.assertEqual(self.split("<p>1</p>"), ["<p>1</p>", ""])
+        self.assertEqual(self.split(""), [""])
+
+    def test_unclosed_p_is_left_in_the_tail(self):
+        self.assertEqual(self.split("<p>1</p><p>2"), ["<p>1</p>", "<p>2", ""])
+
+    def test_matches_old_regex(self):
+        # 旧 findall は "$" が末尾改行の手前にも一致し、末尾の改行だけ別要素に分かれる。連結結果は同じ
+        rng = random.Random(1)
+        for _ in range(20000):
+            s = _random_html(rng, ["<p>", "</p>", "<P>", "a", "\n", "<"], 10)
+            self.assertEqual("".join(self.split(s)), s)
+            if not s.endswith("\n"):
+                self.assertEqual(self.split(s), _old_split_p_chunks(s), s)
+
+
+class ValidateArticleTest(unittest.TestCase):
+    def setUp(self):
+        self.validate = load_defs("strip_tags", "_VALIDATE_TOKEN_RE", "validate_article")["validate_article"]
+
+    def test_clean_article(self):
+        html = "<h2>A</h2><ul><li>x</li></ul><h3>a</h3>" + "<p>文</p>" * 4
+        self.assertEqual(self.validate(html), [])
+
+    def test_each_rule(self):
+        warns = self.validate("<h2>A</h2><h3>a</h3><p>1</p><br><script>x</script>")
+        self.assertEqual(len(warns), 4)
+
+    def test_matches_old_multipass_on_well_formed_html(self):
+        # 閉じていない <h2>/<h3> などの壊れた HTML では旧実装と結果が違う（走査版は開始タグで区切る）
+        rng = random.Random(2)
+        tokens = ["<h2>t</h2>", "<H2>T</H2>", "<h2>a\nb</h2>", "<h3>t</h3>", "<p>x</p>", "<p>\nx\n</p>",
+                  "<ul><li>a</li></ul>", "<table><tr><td>a</td></tr></table>", "<br>", "\n",
+                  "<script>x</script>", "<h4>x</h4>", "x < y"]
+        for _ in range(5000):
+            s = _random_html(rng, tokens, 20)
+            self.assertEqual(self.validate(s), _old_validate_article(s), s)
+
+
+class TrimH2MaxTest(unittest.TestCase):
+    def setUp(self):
+        self.trim = load_defs("H2_RE", "trim_h2_max")["trim_h2_max"]
+
+    def test_trim(self):
+        html = "前<h2>1</h2>a<h2>2</h2>b<h2>3</h2>c"
+        self.assertEqual(self.trim(html, 2), "前<h2>1</h2>a<h2>2</h2>b")
+        self.assertEqual(self.trim(html, 3), html)
+        self.assertEqual(self.trim(html, 0), "前")
+
+    def test_matches_old_split(self):
+        rng = random.Random(3)
+        tokens = ["<h2>", "</h2>", "<H2>", "<h3>", "x", "\n", "<"]
+        for _ in range(20000):
+            s = _random_html(rng, tokens, 12)
+            n = rng.randint(0, 4)
+            self.assertEqual(self.trim(s, n), _old_trim_h2_max(s, n), (s, n))
+
+
+class ParseOutlineTest(unittest.TestCase):
+    def setUp(self):
+        self.parse_outline = load_defs("_OUTLINE_MARK_RE", "parse_outline")["parse_outline"]
+
+    def test_sections(self):
+        raw = "① 読者像:\n- 初心者\n\n② ニーズ:\n- 比較したい\n\n③ 構成:\n<h2>A</h2>\n<h3>a</h3>\n"
+        self.assertEqual(self.parse_outline(raw), ("- 初心者", "- 比較したい", "<h2>A</h2>\n<h3>a</h3>"))
+
+    def test_inline_circled_digit_is_not_a_section(self):
+        raw = "① 読者像:\n- 手順②で迷っている人\n- 初心者\n\n② ニーズ:\n- 早く終えたい\n\n③ 構成:\n<h2>A</h2>\n"
+        readers, needs, structure = self.parse_outline(raw)
+        self.assertEqual(readers, "- 手順②で迷っている人\n- 初心者")
+        self.assertEqual(needs, "- 早く終えたい")
+        self.assertEqual(structure, "<h2>A</h2>")
+
+    def test_markdown_decorated_marks(self):
+        raw = "**① 読者像**\n- 初心者\n\n## ② ニーズ\n- 比較\n\n**③ 構成**\n<h2>A</h2>\n"
+        self.assertEqual(self.parse_outline(raw), ("- 初心者", "- 比較", "<h2>A</h2>"))
+
+
+class ParseOutlineBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.parse = load_defs("orjson", "loads_json", "_JSON_ARRAY_RE", "parse_outline_batch")["parse_outline_batch"]
+
+    def test_matches_by_keyword(self):
+        raw = '前置き [{"keyword": "B", "structure_html": "<h2>B</h2>"}, {"keyword": "A", "readers": "r"}]'
+        out = self.parse(raw, ["A", "B"])
+        self.assertEqual([o["keyword"] for o in out], ["A", "B"])
+        self.assertEqual(out[0]["readers"], "r")
+        self.assertEqual(out[1]["structure_html"], "<h2>B</h2>")
+
+    def test_missing_keyword_is_left_empty(self):
+        raw = '[{"keyword": "A", "structure_html": "<h2>A</h2>"}, {"keyword": "C", "structure_html": "<h2>C</h2>"}]'
+        out = self.parse(raw, ["A", "B", "C"])
+        self.assertEqual([o["structure_html"] for o in out], ["<h2>A</h2>", "", "<h2>C</h2>"])
+
+    def test_items_without_keyword_fall_back_to_position(self):
+        out = self.parse('[{"structure_html": "<h2>1</h2>"}, {"structure_html": "<h2>2</h2>"}]', ["A", "B"])
+        self.assertEqual([o["structure_html"] for o in out], ["<h2>1</h2>", "<h2>2</h2>"])
+
+    def test_broken_json(self):
+        self.assertEqual(self.parse("[{broken", ["A"])[0]["structure_html"], "")
+
+
+class ExtractSectionsTest(unittest.TestCase):
+    def setUp(self):
+        self.extract = load_defs("SECTION_MARKERS", "_SECTION_LABELS", "_BRACKET_RE",
+                                 "extract_sections")["extract_sections"]
+
+    def test_sections(self):
+        text = "[リード文]\nリード\n[本文指示]\n本文\n[まとめ文]\nまとめ\n"
+        self.assertEqual(self.extract(text), ("リード", "本文", "まとめ"))
+
+    def test_no_markers_is_all_body(self):
+        self.assertEqual(self.extract("  ただの指示  "), ("", "ただの指示", ""))
+
+    def test_unclosed_bracket_does_not_swallow_next_marker(self):
+        self.assertEqual(self.extract("[ab\n[まとめ文]a[まとめ文]"), ("", "", "a"))
+
+
+class PreviewSafeHtmlTest(unittest.TestCase):
+    def setUp(self):
+        self.preview = load_defs("_TAG_RE", "ALLOWED_TAGS", "preview_safe_html")["preview_safe_html"]
+
+    def test_keeps_allowed_tags_without_attributes(self):
+        self.assertEqual(self.preview('<h2 class="x">見出し</h2><p onclick="alert(1)">本文</p>'),
+                         "<h2>見出し</h2><p>本文</p>")
+
+    def test_drops_scripts_and_handlers(self):
+        out = self.preview('<p>a</p><img src=x onerror=alert(1)><script>alert(1)</script><svg/onload=alert(1)>')
+        self.assertNotIn("onerror", out)
+        self.assertNotIn("<script", out)
+        self.assertNotIn("<svg", out)
+
+    def test_escapes_stray_lt(self):
+        self.assertEqual(self.preview("<p>1 < 2 <img src=x onerror=alert(1)</p>"), "<p>1 &lt; 2 ")
+
+
+if __name__ == "__main__":
+    unittest.main()